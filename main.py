@@ -2,14 +2,15 @@
 
 from time import sleep
 from datetime import datetime, timedelta
-import socket
 import os
 import logging
-import http.client
 import time
 import random
-import json
 import sys
+import orjson
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from helpers import NotTwoHundredStatusError, ProwlNoticationsClient
 
 logging.captureWarnings(True)
@@ -29,64 +30,99 @@ class TwicketsClient:
 
     MIN_TIME=15
     MAX_TIME=30
+    AUTH_MIN_TIME=180  # need a bigger delay if you get a 403
+    AUTH_MAX_TIME=360
     MAX_RETRIES = 5  # Number of retry attempts
     BASE_DELAY = 60   # Base delay in seconds (exponential backoff)
+    REQUEST_TIMEOUT = 10  # Seconds to wait on connect/read before giving up
+    MAX_BACKOFF = 3600  # Upper cap on any single backoff sleep
+    QUIET_START_HOUR = 22  # No polling from this hour...
+    QUIET_END_HOUR = 8     # ...until this hour the next morning
 
     def __init__(self):
         self.api_key = os.getenv("TWICKETS_API_KEY")
         self.email = os.getenv("TWICKETS_EMAIL")
         self.password = os.getenv("TWICKETS_PASSWORD")
         self.event_id = os.getenv("TWICKETS_EVENT_ID")
+        self._auth_url = f"https://{self.BASE_URL}/services/auth/login?api_key={self.api_key}"
+        self._listings_url = f"https://{self.BASE_URL}/services/g2/inventory/listings/{self.event_id}?api_key={self.api_key}"
+        self._login_body = orjson.dumps({
+            "login": self.email,
+            "password": self.password,
+            "accountType": "U",
+        })
         
         self.token = None
-        self.conn = http.client.HTTPSConnection(self.BASE_URL)
-
-        self.headers = {
-        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:101.0) Gecko/20100101 Firefox/101.0',
-            'Accept-Encoding': 'gzip, deflate',
+        self._rng = random.Random()
+        self._etag = None
+        self._last_items = []
+        self.session = requests.Session()
+        retries = Retry(
+            total=self.MAX_RETRIES,
+            connect=5,
+            read=3,
+            backoff_factor=self.BASE_DELAY,
+            status_forcelist=[429, 500, 502, 503, 504],  # 403 is handled by run() with re-auth
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        self.session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=retries))
+        self.session.headers.update({
+            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:101.0) Gecko/20100101 Firefox/101.0',
             'Accept': '*/*',
             'Connection': 'keep-alive',
             'Content-Type': 'application/json',
             'Cache-Control': 'no-cache'
-        }
+        })
         self.prowl = ProwlNoticationsClient()
 
-    NOTIFIED_IDS_FILE = "notified_ids.json"
+    NOTIFIED_IDS_FILE = "notified_ids.log"
+    LEGACY_NOTIFIED_IDS_FILE = "notified_ids.json"
+
+    def _parse_listing_id(self, raw_id):
+        """Return a listing ID as an int when str(int) round-trips exactly, otherwise as a str."""
+        if raw_id.isascii() and raw_id.isdecimal() and not raw_id.startswith("0"):
+            return int(raw_id)
+        return raw_id
 
     def load_notified_ids(self):
-        """Load notified IDs from a file."""
-        if os.path.exists(self.NOTIFIED_IDS_FILE):
-            try:
-                with open(self.NOTIFIED_IDS_FILE, "r") as f:
-                    return set(json.load(f))
-            except json.JSONDecodeError:
-                return set()
-        return set()
-
-    def save_notified_ids(self,notified_ids):
-        """Save notified IDs to a file."""
-        with open(self.NOTIFIED_IDS_FILE, "w") as f:
-            json.dump(list(notified_ids), f)
-
-    def _ensure_connection(self):
-        """Ensure the connection is open, reconnect if necessary."""
-        retries = 0
-        while retries < self.MAX_RETRIES:
-            try:
-                logging.debug(f"Attempting connection to {self.conn.host}")
-                self.conn.connect()
-                logging.debug("Connection successful")
-                return
-            except socket.gaierror as ge:
-                logging.warning(f"DNS resolution failed: {ge}. Retrying in {BASE_DELAY * (2 ** retries)}s...")
-            except (http.client.HTTPException, OSError):
-                logging.warning("Connection error")
-                self.conn.close()
-                self.conn = http.client.HTTPSConnection(self.BASE_URL)
-                self.conn.connect()
-            retries += 1
-            time.sleep(self.BASE_DELAY * (2 ** retries))
-        logging.error("Max retries reached. Could not establish a connection.")
+        """Load notified IDs from the append-only log, one ID per line."""
+        try:
+            with open(self.NOTIFIED_IDS_FILE, "r") as f:
+                return {self._parse_listing_id(line.rstrip()) for line in f if line.strip()}
+        except FileNotFoundError:
+            return self._migrate_legacy_notified_ids()
+
+    def _migrate_legacy_notified_ids(self):
+        """Seed the log from the old JSON notified IDs file, if present."""
+        try:
+            with open(self.LEGACY_NOTIFIED_IDS_FILE, "rb") as f:
+                legacy_ids = orjson.loads(f.read())
+        except (FileNotFoundError, orjson.JSONDecodeError):
+            return set()
+        notified_ids = {self._parse_listing_id(str(legacy_id)) for legacy_id in legacy_ids}
+        self._append_notified_ids(notified_ids)
+        logging.debug("Migrated %s notified IDs from %s", len(notified_ids), self.LEGACY_NOTIFIED_IDS_FILE)
+        return notified_ids
+
+    def _append_notified_ids(self, new_ids):
+        """Append newly notified IDs to the log."""
+        with open(self.NOTIFIED_IDS_FILE, "a") as f:
+            f.writelines(f"{notified_id}\n" for notified_id in new_ids)
+
+    def _schedule_quiet_hours(self):
+        """ store the current or next overnight quiet window as unix timestamps """
+        now = datetime.now()
+        start = now.replace(hour=self.QUIET_START_HOUR, minute=0, second=0, microsecond=0)
+        if now.hour < self.QUIET_END_HOUR:
+            start -= timedelta(days=1)
+        end = (start + timedelta(days=1)).replace(hour=self.QUIET_END_HOUR)
+        self._quiet_start_ts = start.timestamp()
+        self._quiet_end_ts = end.timestamp()
+
+    def _backoff(self, base, attempt):
+        """ exponential backoff with full jitter, drawn from a range capped at MAX_BACKOFF """
+        return self._rng.uniform(0, min(self.MAX_BACKOFF, base * (2 ** attempt)))
 
     def check_env_variables(self):
         """ check required keys all present """
@@ -108,48 +144,38 @@ class TwicketsClient:
 
     def authenticate(self):
         """Log in to the Twickets website."""
-        self._ensure_connection()
-        url = f"/services/auth/login?api_key={self.api_key}"
-        data = json.dumps({
-            "login": self.email,
-            "password": self.password,
-            "accountType": "U",
-        })
         logging.debug("about to connect")
-        self.conn.request("POST", url, body=data, headers=self.headers)
-        response = self.conn.getresponse()
-        if response.status == 200:
-            result = json.loads(response.read().decode())
+        response = self.session.post(self._auth_url, data=self._login_body, timeout=self.REQUEST_TIMEOUT)
+        if response.status_code == 200:
+            result = orjson.loads(response.content)
             token = self.validate_auth_response(result)
             logging.debug("Authenticated successfully")
             return token
-        logging.warning(f"Authentication error status {response.status}")
+        logging.warning("Authentication error status %s", response.status_code)
         return None
 
     def check_event_availability(self):
         """ Check ticket availability """
-        logging.debug("Connection socket is none: %s",(self.conn.sock is None))
-        self._ensure_connection()
-        url = f"/services/g2/inventory/listings/{self.event_id}?api_key={self.api_key}"
-        if self.conn.sock is not None:
-            try:
-                logging.debug("Get response")
-                self.conn.request("GET", url, headers=self.headers)
-                response = self.conn.getresponse()
-                if response.status == 200:
-                    result = json.loads(response.read().decode())
-                    code = result.get("responseCode")
-                    clock_val = result.get("clock")
-                    items = result.get("responseData")
-                    logging.debug("Response code %s, clock %s, tickets %s",code, clock_val, len(items))
-                    return items
-                raise NotTwoHundredStatusError(f"Check availability status: {response.status}")
-            except http.client.ResponseNotReady:
-                logging.debug("http.client.ResponseNotReady exception")
-                pass
-            except http.client.HTTPException:
-                self.conn.close()
-        return []
+        headers = {'If-None-Match': self._etag} if self._etag else None
+        logging.debug("Get response")
+        try:
+            response = self.session.get(self._listings_url, headers=headers, timeout=self.REQUEST_TIMEOUT)
+        except requests.RequestException as e:
+            logging.warning("Check availability request failed: %s", e)
+            return []
+        if response.status_code == 304:
+            logging.debug("Listings not modified")
+            return self._last_items
+        if response.status_code == 200:
+            self._etag = response.headers.get('ETag')
+            result = orjson.loads(response.content)
+            code = result.get("responseCode")
+            clock_val = result.get("clock")
+            items = result.get("responseData")
+            logging.debug("Response code %s, clock %s, tickets %s",code, clock_val, len(items))
+            self._last_items = items
+            return items
+        raise NotTwoHundredStatusError(f"Check availability status: {response.status_code}")
     
     def run(self):
         """ run da ting """
@@ -165,51 +191,49 @@ class TwicketsClient:
             START_MESSAGE = "starting ticket check"
             logging.debug(START_MESSAGE)  
             attempts = 0
+            self._schedule_quiet_hours()
             while True:
-                now = datetime.now()
+                now_ts = time.time()
                 # Check if it's past 22:00, sleep until 08:00
-                if now.hour >= 22 or now.hour < 8:
-                    tomorrow = now + timedelta(days=1)
-                    wake_time = datetime(tomorrow.year, tomorrow.month, tomorrow.day, 8, 0, 0)
-                    sleep_duration = (wake_time - now).total_seconds()
-                    logging.debug(f"Sleeping from {now.strftime('%H:%M:%S')} until {wake_time.strftime('%H:%M:%S')}")
-                    time.sleep(sleep_duration)
+                if now_ts >= self._quiet_start_ts:
+                    wake_time = time.localtime(self._quiet_end_ts)
+                    logging.debug("Sleeping from %s until %s", time.strftime('%H:%M:%S'), time.strftime('%H:%M:%S', wake_time))
+                    time.sleep(max(self._quiet_end_ts - now_ts, 0))
+                    self._schedule_quiet_hours()
                     count = 1
                     continue  # Restart loop after waking up
 
-                time_delay = round(random.uniform(self.MIN_TIME,self.MAX_TIME))
-                auth_time_delay = round(random.uniform(180,360)) # need a bigger delay if you get a 403    
+                time_delay = self._rng.randint(self.MIN_TIME, self.MAX_TIME)
+                auth_time_delay = self._rng.randint(self.AUTH_MIN_TIME, self.AUTH_MAX_TIME)    
                 
                 try:
-                    logging.debug("Check cycle %s at %s with %s seconds delay",count,now.strftime("%H:%M:%S"),time_delay)
+                    logging.debug("Check cycle %s at %s with %s seconds delay",count,time.strftime("%H:%M:%S"),time_delay)
                     items = self.check_event_availability()
                     #reset everything if items returned
                     backoff = 0
                     attempts = 0
                     count +=1
                     if items:
-                        for item in items:
-                            id = str(items['id']).split('@')[1]
-                            if id not in notified_ids:
-                                url = f"https://www.twickets.live/app/block/{id},1"
-                                self.prowl.send_notification(f"Check {url}")
-                                notified_ids.add(id)
-                                self.save_notified_ids(notified_ids)
+                        ids_this_cycle = {self._parse_listing_id(str(item['id']).rpartition('@')[2]) for item in items}
+                        new_ids = ids_this_cycle - notified_ids
+                        if new_ids:
+                            urls = ", ".join(f"https://www.twickets.live/app/block/{listing_id},1" for listing_id in new_ids)
+                            self.prowl.send_notification(f"{len(new_ids)} new tickets: {urls}")
+                            notified_ids |= new_ids
+                            self._append_notified_ids(new_ids)
                     SLEEP_INTERVAL = time_delay + (backoff)
                     sleep(SLEEP_INTERVAL)
                 except NotTwoHundredStatusError as error_msg:
-                    logging.debug(f"{error_msg} %s. Attempt {attempts}",now.strftime("%H:%M:%S"))
+                    logging.debug("%s %s. Attempt %s", error_msg, time.strftime("%H:%M:%S"), attempts)
                     items = None
                     if attempts > self.MAX_RETRIES:
                         #give up
-                        self.save_notified_ids(notified_ids)
                         exit_error_message = "Exiting after five failed login attempts"
                         self.prowl.send_notification(exit_error_message)
                         sys.exit(exit_error_message)
-                    SLEEP_INTERVAL = auth_time_delay * (2 ** attempts)
-                    new_time = now + timedelta(seconds=SLEEP_INTERVAL)
-                    logging.debug("Pausing due to 403 error. Resuming at %s", new_time.strftime("%H:%M:%S"))
-                    self.conn.close()
+                    SLEEP_INTERVAL = self._backoff(auth_time_delay, attempts)
+                    new_time = time.localtime(time.time() + SLEEP_INTERVAL)
+                    logging.debug("Pausing due to 403 error. Resuming at %s", time.strftime("%H:%M:%S", new_time))
                     sleep(SLEEP_INTERVAL)
                     attempts+=1
                     token = self.authenticate()
@@ -218,10 +242,8 @@ class TwicketsClient:
         except KeyboardInterrupt:
             QUIT_MESSAGE = "User interrupted connection with ctrl-C on cycle %s"
             logging.debug(QUIT_MESSAGE, count)
-            self.conn.close()
-            self.save_notified_ids(notified_ids)
+            self.session.close()
         except Exception as e:
-            self.save_notified_ids(notified_ids)
             logging.error("Cycle %s Caught exception of type %s",count, type(e).__name__)
             error_msg = f"Cycle {count} Caught exception {e}"
             self.prowl.send_notification(error_msg)
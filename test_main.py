@@ -0,0 +1,61 @@
+""" tests for the twickets client """
+
+import os
+import random
+import tempfile
+import unittest
+from main import TwicketsClient
+
+
+class BackoffTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = TwicketsClient()
+        self.client._rng = random.Random(1234)
+
+    def test_backoff_is_seeded_full_jitter(self):
+        """ delays come from the injected rng, uniform over [0, base * 2**attempt] """
+        expected = random.Random(1234)
+        for attempt in range(3):
+            self.assertEqual(self.client._backoff(180, attempt), expected.uniform(0, 180 * (2 ** attempt)))
+
+    def test_backoff_caps_range_not_draw(self):
+        """ large attempts stay jittered below MAX_BACKOFF rather than pinning to it """
+        delays = [self.client._backoff(360, 5) for _ in range(100)]
+        self.assertTrue(all(0 <= d <= TwicketsClient.MAX_BACKOFF for d in delays))
+        self.assertEqual(len(set(delays)), len(delays))
+
+
+
+class NotifiedIdsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = TwicketsClient()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.client.NOTIFIED_IDS_FILE = os.path.join(self.tmpdir.name, "notified_ids.log")
+        self.client.LEGACY_NOTIFIED_IDS_FILE = os.path.join(self.tmpdir.name, "notified_ids.json")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_legacy_json_seeds_log(self):
+        """ a missing log falls back to the old JSON file once and migrates it """
+        with open(self.client.LEGACY_NOTIFIED_IDS_FILE, "w") as f:
+            f.write('["123", "abc"]')
+        expected = self.client.load_notified_ids()
+        self.assertEqual(len(expected), 2)
+        os.remove(self.client.LEGACY_NOTIFIED_IDS_FILE)
+        self.assertEqual(self.client.load_notified_ids(), expected)
+
+    def test_parse_listing_id_round_trips(self):
+        """ only IDs whose int form prints identically are converted """
+        self.assertEqual(self.client._parse_listing_id("123"), 123)
+        for raw_id in ("0123", "0", "²", "abc"):
+            self.assertEqual(self.client._parse_listing_id(raw_id), raw_id)
+
+    def test_no_files_is_empty(self):
+        self.assertEqual(self.client.load_notified_ids(), set())
+
+
+if __name__ == "__main__":
+    unittest.main()